@@ -25,6 +25,18 @@ class Config:
     twitch_client_secret: str
     live_poll_seconds: int
 
+    # Archive
+    archive_check_seconds: int
+    archive_batch_size: int
+
+    # Blocklist
+    blocklist_file: str
+
+    # Diagnostics
+    loop_lag_threshold_ms: int
+    profile_dir: str
+    profile_seconds: int
+
     @staticmethod
     def _int(name: str, default: int) -> int:
         try:
@@ -47,4 +59,10 @@ class Config:
             twitch_client_id=os.environ["TWITCH_CLIENT_ID"].strip(),
             twitch_client_secret=os.environ["TWITCH_CLIENT_SECRET"].strip(),
             live_poll_seconds=Config._int("LIVE_POLL_SECONDS", 60),
+            archive_check_seconds=Config._int("ARCHIVE_CHECK_SECONDS", 300),
+            archive_batch_size=Config._int("ARCHIVE_BATCH_SIZE", 500),
+            blocklist_file=os.getenv("BLOCKLIST_FILE", "").strip(),
+            loop_lag_threshold_ms=Config._int("LOOP_LAG_THRESHOLD_MS", 250),
+            profile_dir=os.getenv("PROFILE_DIR", "profiles").strip(),
+            profile_seconds=Config._int("PROFILE_SECONDS", 30),
         )
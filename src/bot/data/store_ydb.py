@@ -1,11 +1,38 @@
 from __future__ import annotations
+import hashlib
+import logging
 import os
-from typing import List, Tuple
+from typing import Dict, List, Sequence, Tuple
 
 import ydb
 import ydb.aio
 
+from bot.util.time import month_key
+
+log = logging.getLogger(__name__)
+
+# Основная горячая таблица: ключ — стабильный Twitch user-id, переименования не рвут историю
 SCHEMA_YQL = """
+CREATE TABLE IF NOT EXISTS watchtime_ids (
+  month Utf8,
+  user_id Uint64,
+  minutes Uint64,
+  PRIMARY KEY (month, user_id)
+);
+"""
+
+# Соответствие user-id <-> логин (последний увиденный)
+USERS_SCHEMA_YQL = """
+CREATE TABLE IF NOT EXISTS users (
+  user_id Uint64,
+  login Utf8,
+  PRIMARY KEY (user_id),
+  INDEX idx_login GLOBAL ON (login)
+);
+"""
+
+# Старая таблица по логинам: только читается и постепенно сливается в watchtime_ids / архив
+LEGACY_SCHEMA_YQL = """
 CREATE TABLE IF NOT EXISTS watchtime (
   month Utf8,
   user Utf8,
@@ -14,6 +41,51 @@ CREATE TABLE IF NOT EXISTS watchtime (
 );
 """
 
+# Холодный архив закрытых месяцев по user-id (login — для отображения): колоночная таблица (сжатие по колонкам, дешёвые сканы)
+ARCHIVE_SCHEMA_COLUMN_YQL = """
+CREATE TABLE IF NOT EXISTS watchtime_archive (
+  month Utf8 NOT NULL,
+  user_id Uint64 NOT NULL,
+  login Utf8 NOT NULL,
+  minutes Uint64 NOT NULL,
+  PRIMARY KEY (month, user_id)
+)
+PARTITION BY HASH(month)
+WITH (STORE = COLUMN);
+"""
+
+# Фолбэк, если БД не умеет колоночные таблицы: строковая таблица со сжатием lz4
+ARCHIVE_SCHEMA_ROW_YQL = """
+CREATE TABLE IF NOT EXISTS watchtime_archive (
+  month Utf8 NOT NULL,
+  user_id Uint64 NOT NULL,
+  login Utf8 NOT NULL,
+  minutes Uint64 NOT NULL,
+  PRIMARY KEY (month, user_id),
+  FAMILY default (COMPRESSION = "lz4")
+);
+"""
+
+# Отметки о полностью скопированных в архив месяцах
+ARCHIVED_SCHEMA_YQL = """
+CREATE TABLE IF NOT EXISTS watchtime_archived (
+  month Utf8,
+  row_count Uint64,
+  PRIMARY KEY (month)
+);
+"""
+
+ARCHIVE_COLUMNS = (
+    ydb.BulkUpsertColumns()
+    .add_column("month", ydb.PrimitiveType.Utf8)
+    .add_column("user_id", ydb.PrimitiveType.Uint64)
+    .add_column("login", ydb.PrimitiveType.Utf8)
+    .add_column("minutes", ydb.PrimitiveType.Uint64)
+)
+
+# лимит строк в результате data query
+MAX_BATCH = 1000
+
 def _esc(s: str) -> str:
     """Экранирует одинарные кавычки для YQL строк."""
     return str(s).replace("'", "''")
@@ -29,12 +101,29 @@ def _credentials():
     # 3) Токен из env (YDB_TOKEN/YC_TOKEN)
     return ydb.credentials_from_env()
 
+def _legacy_id(login: str) -> int:
+    """Стабильный синтетический id для логина из старой таблицы, которого нет в users.
+    Старший бит поднят — с настоящими Twitch user-id не пересекается."""
+    h = hashlib.blake2b(login.encode("utf-8"), digest_size=8).digest()
+    return (1 << 63) | (int.from_bytes(h, "big") >> 1)
+
+def _chunks(seq: Sequence, size: int):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def _str_list(values) -> str:
+    return ", ".join(f"'{_esc(v)}'" for v in values)
+
+def _int_list(values) -> str:
+    return ", ".join(f"{int(v)}ul" for v in values)
+
 class WatchtimeStoreYDB:
     def __init__(self, endpoint: str, database: str) -> None:
         self.endpoint = endpoint
         self.database = database
         self.driver: ydb.aio.Driver | None = None
         self.pool: ydb.aio.SessionPool | None = None
+        self._archived: set[str] = set()  # кэш месяцев, уже лежащих в архиве
 
     async def init(self) -> None:
         creds = _credentials()
@@ -50,6 +139,14 @@ class WatchtimeStoreYDB:
         # создаём схему
         async with self.pool.checkout() as s:
             await s.execute_scheme(SCHEMA_YQL)
+            await s.execute_scheme(USERS_SCHEMA_YQL)
+            await s.execute_scheme(LEGACY_SCHEMA_YQL)
+            await s.execute_scheme(ARCHIVED_SCHEMA_YQL)
+            try:
+                await s.execute_scheme(ARCHIVE_SCHEMA_COLUMN_YQL)
+            except ydb.Error as e:
+                log.warning("Column tables unavailable (%s), archive uses a compressed row table", e)
+                await s.execute_scheme(ARCHIVE_SCHEMA_ROW_YQL)
 
     async def close(self) -> None:
         if self.pool:
@@ -57,60 +154,120 @@ class WatchtimeStoreYDB:
         if self.driver:
             await self.driver.stop()
 
-    async def add_minutes(self, month: str, user: str, delta: int) -> None:
+    async def add_minutes(self, month: str, user_id: int, delta: int) -> None:
+        await self.add_minutes_bulk(month, [user_id], delta)
+
+    async def add_minutes_bulk(self, month: str, user_ids: Sequence[int], delta: int) -> None:
+        """+delta минут сразу многим: на батч одно чтение и один UPSERT вместо транзакции на каждого."""
         assert self.pool is not None
         d = max(0, int(delta))
         m = _esc(month)
-        u = _esc(user)
-
-        async with self.pool.checkout() as s:
-            tx = s.transaction(ydb.SerializableReadWrite())
-            await tx.begin()
+        for chunk in _chunks(user_ids, MAX_BATCH):
+            async with self.pool.checkout() as s:
+                tx = s.transaction(ydb.SerializableReadWrite())
+                await tx.begin()
 
-            # читаем текущее
-            rs = await tx.execute(
-                f"""
-                SELECT minutes FROM watchtime
-                WHERE month = '{m}' AND user = '{u}';
-                """
-            )
-            rows = rs[0].rows
-            if rows:
-                await tx.execute(
+                # читаем текущее
+                rs = await tx.execute(
                     f"""
-                    UPDATE watchtime
-                    SET minutes = minutes + {d}
-                    WHERE month = '{m}' AND user = '{u}';
+                    SELECT user_id, minutes FROM watchtime_ids
+                    WHERE month = '{m}' AND user_id IN ({_int_list(chunk)});
                     """
                 )
-            else:
+                current = {int(r["user_id"]): int(r["minutes"]) for r in rs[0].rows}
+                values = ", ".join(f"('{m}', {int(u)}ul, {current.get(int(u), 0) + d}ul)" for u in chunk)
                 await tx.execute(
                     f"""
-                    UPSERT INTO watchtime (month, user, minutes)
-                    VALUES ('{m}', '{u}', {d});
+                    UPSERT INTO watchtime_ids (month, user_id, minutes)
+                    VALUES {values};
+                    """
+                )
+                await tx.commit()
+
+    async def upsert_users(self, month: str, logins: Dict[int, str]) -> None:
+        """
+        Записывает соответствие user-id -> логин.
+        Заодно сливает минуты этих логинов за month из старой таблицы watchtime в watchtime_ids.
+        """
+        assert self.pool is not None
+        m = _esc(month)
+        items = list(logins.items())
+        for chunk in _chunks(items, MAX_BATCH):
+            by_login = {login: uid for uid, login in chunk}
+            async with self.pool.checkout() as s:
+                tx = s.transaction(ydb.SerializableReadWrite())
+                await tx.begin()
+
+                rs = await tx.execute(
+                    f"""
+                    SELECT user, minutes FROM watchtime
+                    WHERE month = '{m}' AND user IN ({_str_list(by_login)});
                     """
                 )
+                legacy = {by_login[r["user"]]: int(r["minutes"]) for r in rs[0].rows}
+                current: Dict[int, int] = {}
+                if legacy:
+                    rs = await tx.execute(
+                        f"""
+                        SELECT user_id, minutes FROM watchtime_ids
+                        WHERE month = '{m}' AND user_id IN ({_int_list(legacy)});
+                        """
+                    )
+                    current = {int(r["user_id"]): int(r["minutes"]) for r in rs[0].rows}
 
-            await tx.commit()
+                # после чтений — записи
+                users = ", ".join(f"({int(uid)}ul, '{_esc(login)}')" for uid, login in chunk)
+                await tx.execute(f"UPSERT INTO users (user_id, login) VALUES {users};")
+                if legacy:
+                    values = ", ".join(
+                        f"('{m}', {uid}ul, {current.get(uid, 0) + mins}ul)" for uid, mins in legacy.items()
+                    )
+                    folded = [logins[uid] for uid in legacy]
+                    await tx.execute(
+                        f"""
+                        UPSERT INTO watchtime_ids (month, user_id, minutes) VALUES {values};
+                        DELETE FROM watchtime WHERE month = '{m}' AND user IN ({_str_list(folded)});
+                        """
+                    )
+                await tx.commit()
 
-    async def get_minutes(self, month: str, user: str) -> int:
+    async def resolve_login(self, login: str) -> int | None:
+        """user-id по последнему известному логину."""
         assert self.pool is not None
+        lg = _esc(login.lower())
+        async with self.pool.checkout() as s:
+            tx = s.transaction(ydb.StaleReadOnly())
+            rs = await tx.execute(
+                f"SELECT user_id FROM users VIEW idx_login WHERE login = '{lg}' LIMIT 1;",
+                commit_tx=True,
+            )
+            rows = rs[0].rows
+            return int(rows[0]["user_id"]) if rows else None
+
+    async def get_minutes(self, month: str, login: str, user_id: int | None = None) -> int:
+        """Минуты за месяц: по user-id (если не передан — ищем по логину) плюс ещё не слитая строка старой таблицы."""
+        assert self.pool is not None
+        if user_id is None:
+            user_id = await self.resolve_login(login)
         m = _esc(month)
-        u = _esc(user)
+        lg = _esc(login.lower())
+        uid = int(user_id) if user_id is not None else 0
         async with self.pool.checkout() as s:
             tx = s.transaction(ydb.StaleReadOnly())
             rs = await tx.execute(
                 f"""
+                SELECT minutes FROM watchtime_ids
+                WHERE month = '{m}' AND user_id = {uid}ul;
                 SELECT minutes FROM watchtime
-                WHERE month = '{m}' AND user = '{u}';
+                WHERE month = '{m}' AND user = '{lg}';
                 """,
                 commit_tx=True,
             )
-            rows = rs[0].rows
-            return int(rows[0]["minutes"]) if rows else 0
+            return sum(int(r["minutes"]) for part in rs for r in part.rows)
 
     async def get_top(self, month: str, n: int, exclude: list[str] | None = None) -> list[tuple[str, int]]:
-        """Топ N за месяц, с возможностью исключить логины (бота, стримера и т.п.)."""
+        """Топ N за месяц, с возможностью исключить логины (бота, стримера и т.п.).
+        Закрытые месяцы, перенесённые в архив, читаются из архива."""
         assert self.pool is not None
         m = _esc(month)
         lim = max(1, min(50, int(n)))
@@ -118,14 +275,33 @@ class WatchtimeStoreYDB:
         # нормализуем в нижний регистр и убираем пустые/дубли
         ex_norm = sorted(set([e.lower() for e in ex if e]))
         not_in = ""
+        login_ok = ""
+        login_not_in = ""
         if ex_norm:
-            ex_list = ", ".join(f"'{_esc(x)}'" for x in ex_norm)
+            ex_list = _str_list(ex_norm)
             not_in = f" AND user NOT IN ({ex_list})"
+            login_not_in = f" AND login NOT IN ({ex_list})"
+            login_ok = f"WHERE u.login IS NULL OR u.login NOT IN ({ex_list})"
+
+        if month < month_key() and await self.is_archived(month):
+            return await self._get_top_archive(m, lim, login_not_in)
 
         async with self.pool.checkout() as s:
             tx = s.transaction(ydb.StaleReadOnly())
+            # join с users только для верхушки: исключённых не больше len(ex_norm)
             rs = await tx.execute(
                 f"""
+                $top = SELECT user_id, minutes FROM watchtime_ids
+                    WHERE month = '{m}'
+                    ORDER BY minutes DESC, user_id ASC
+                    LIMIT {lim + len(ex_norm)};
+                SELECT t.user_id AS user_id, u.login AS login, t.minutes AS minutes
+                FROM $top AS t
+                LEFT JOIN users AS u ON u.user_id = t.user_id
+                {login_ok}
+                ORDER BY minutes DESC, login ASC
+                LIMIT {lim};
+
                 SELECT user, minutes
                 FROM watchtime
                 WHERE month = '{m}'{not_in}
@@ -134,4 +310,211 @@ class WatchtimeStoreYDB:
                 """,
                 commit_tx=True,
             )
-            return [(r["user"], int(r["minutes"])) for r in rs[0].rows]
+        # не слитая ещё строка старой таблицы суммируется с новой, как в get_minutes
+        totals: Dict[str, int] = {}
+        for r in rs[0].rows:
+            login = r["login"] or str(r["user_id"])
+            totals[login] = totals.get(login, 0) + int(r["minutes"])
+        for r in rs[1].rows:
+            totals[r["user"]] = totals.get(r["user"], 0) + int(r["minutes"])
+        top = sorted(totals.items(), key=lambda x: (-x[1], x[0]))
+        return top[:lim]
+
+    async def _get_top_archive(self, m: str, lim: int, not_in: str) -> list[tuple[str, int]]:
+        # scan query читает и колоночные, и строковые таблицы
+        assert self.driver is not None
+        it = await self.driver.table_client.scan_query(
+            f"""
+            SELECT login, minutes
+            FROM watchtime_archive
+            WHERE month = '{m}'{not_in}
+            ORDER BY minutes DESC, login ASC
+            LIMIT {lim};
+            """
+        )
+        top: list[tuple[str, int]] = []
+        async for part in it:
+            top.extend((r["login"], int(r["minutes"])) for r in part.result_set.rows)
+        return top
+
+    # ---------- архив ----------
+
+    async def closed_months(self, current: str) -> list[str]:
+        """Месяцы раньше current, которые ещё лежат в горячих таблицах (новой и старой)."""
+        assert self.pool is not None
+        c = _esc(current)
+        async with self.pool.checkout() as s:
+            tx = s.transaction(ydb.OnlineReadOnly())
+            rs = await tx.execute(
+                f"""
+                SELECT DISTINCT month FROM watchtime_ids WHERE month < '{c}';
+                SELECT DISTINCT month FROM watchtime WHERE month < '{c}';
+                """,
+                commit_tx=True,
+            )
+            return sorted({r["month"] for part in rs for r in part.rows})
+
+    async def is_archived(self, month: str) -> bool:
+        if month in self._archived:
+            return True
+        assert self.pool is not None
+        m = _esc(month)
+        async with self.pool.checkout() as s:
+            tx = s.transaction(ydb.StaleReadOnly())
+            rs = await tx.execute(
+                f"SELECT month FROM watchtime_archived WHERE month = '{m}';",
+                commit_tx=True,
+            )
+            if rs[0].rows:
+                self._archived.add(month)
+                return True
+            return False
+
+    async def archive_month(self, month: str, batch_size: int = 500) -> int:
+        """
+        Переносит закрытый месяц в архив постранично: страница копируется через bulk upsert,
+        затем из горячей таблицы удаляются ровно скопированные пары (ключ, minutes).
+        Строка, изменившаяся между копированием и удалением, остаётся и уйдёт следующим проходом.
+        Звать только после grace-периода (см. MonthArchiver): удалённая строка не должна появиться снова.
+        Архив ключуется по user-id; строки старой таблицы сначала сливаются в watchtime_ids.
+        Возвращает число перенесённых строк.
+        """
+        assert self.pool is not None
+        m = _esc(month)
+        lim = max(1, min(MAX_BATCH, int(batch_size)))
+
+        await self._fold_legacy(month, lim)
+        # в старой таблице остались логины без user-id — уходят в архив под синтетическим id
+        moved = await self._move_pages(
+            month, "watchtime", "user", _str_list,
+            lambda last: f"""
+                SELECT user, minutes FROM watchtime
+                WHERE month = '{m}' AND user > '{_esc(last or "")}'
+                ORDER BY user
+                LIMIT {lim};
+                """,
+            lambda r: (_legacy_id(r["user"]), r["user"]),
+        )
+        # новая таблица по user-id, логины подтягиваем из users
+        moved += await self._move_pages(
+            month, "watchtime_ids", "user_id", _int_list,
+            lambda last: f"""
+                $page = SELECT user_id, minutes FROM watchtime_ids
+                    WHERE month = '{m}' AND user_id > {int(last or 0)}ul
+                    ORDER BY user_id
+                    LIMIT {lim};
+                SELECT p.user_id AS user_id, p.minutes AS minutes, u.login AS login
+                FROM $page AS p
+                LEFT JOIN users AS u ON u.user_id = p.user_id
+                ORDER BY user_id;
+                """,
+            lambda r: (int(r["user_id"]), r["login"] or str(r["user_id"])),
+        )
+
+        if not await self.is_archived(month):
+            async with self.pool.checkout() as s:
+                tx = s.transaction(ydb.SerializableReadWrite())
+                await tx.execute(
+                    f"UPSERT INTO watchtime_archived (month, row_count) VALUES ('{m}', {moved});",
+                    commit_tx=True,
+                )
+            self._archived.add(month)
+        return moved
+
+    async def _fold_legacy(self, month: str, lim: int) -> None:
+        """Сливает строки старой таблицы за month в watchtime_ids, если логин известен в users."""
+        assert self.pool is not None
+        m = _esc(month)
+        last = ""
+        while True:
+            async with self.pool.checkout() as s:
+                tx = s.transaction(ydb.SerializableReadWrite())
+                await tx.begin()
+                rs = await tx.execute(
+                    f"""
+                    SELECT user, minutes FROM watchtime
+                    WHERE month = '{m}' AND user > '{_esc(last)}'
+                    ORDER BY user
+                    LIMIT {lim};
+                    """
+                )
+                page = {r["user"]: int(r["minutes"]) for r in rs[0].rows}
+                if not page:
+                    await tx.rollback()
+                    return
+                last = max(page)
+
+                # логин мог перейти к другому аккаунту — берём самый свежий id
+                rs = await tx.execute(
+                    f"""
+                    SELECT login, MAX(user_id) AS user_id FROM users VIEW idx_login
+                    WHERE login IN ({_str_list(page)})
+                    GROUP BY login;
+                    """
+                )
+                ids = {r["login"]: int(r["user_id"]) for r in rs[0].rows}
+                if not ids:
+                    await tx.rollback()
+                    continue
+                add: Dict[int, int] = {}
+                for login, uid in ids.items():
+                    add[uid] = add.get(uid, 0) + page[login]
+                rs = await tx.execute(
+                    f"""
+                    SELECT user_id, minutes FROM watchtime_ids
+                    WHERE month = '{m}' AND user_id IN ({_int_list(add)});
+                    """
+                )
+                current = {int(r["user_id"]): int(r["minutes"]) for r in rs[0].rows}
+
+                # после чтений — записи
+                values = ", ".join(f"('{m}', {uid}ul, {current.get(uid, 0) + mins}ul)" for uid, mins in add.items())
+                await tx.execute(
+                    f"""
+                    UPSERT INTO watchtime_ids (month, user_id, minutes) VALUES {values};
+                    DELETE FROM watchtime WHERE month = '{m}' AND user IN ({_str_list(ids)});
+                    """
+                )
+                await tx.commit()
+
+    async def _move_pages(self, month: str, table: str, key: str, fmt, page_query, archive_key) -> int:
+        # archive_key(row) -> (user_id, login) для строки архива
+        assert self.pool is not None and self.driver is not None
+        m = _esc(month)
+        archive = f"{self.database}/watchtime_archive"
+        moved = 0
+        last = None
+        while True:
+            async with self.pool.checkout() as s:
+                tx = s.transaction(ydb.OnlineReadOnly())
+                rs = await tx.execute(page_query(last), commit_tx=True)
+            rows = rs[0].rows
+            if not rows:
+                return moved
+            batch = []
+            for r in rows:
+                uid, login = archive_key(r)
+                batch.append({"month": month, "user_id": uid, "login": login, "minutes": int(r["minutes"])})
+            await self.driver.table_client.bulk_upsert(archive, batch, ARCHIVE_COLUMNS)
+
+            # удаляем только то, что не изменилось после копирования
+            copied = {r[key]: int(r["minutes"]) for r in rows}
+            async with self.pool.checkout() as s:
+                tx = s.transaction(ydb.SerializableReadWrite())
+                await tx.begin()
+                rs = await tx.execute(
+                    f"""
+                    SELECT {key}, minutes FROM {table}
+                    WHERE month = '{m}' AND {key} IN ({fmt(copied)});
+                    """
+                )
+                same = [r[key] for r in rs[0].rows if copied.get(r[key]) == int(r["minutes"])]
+                if same:
+                    await tx.execute(
+                        f"DELETE FROM {table} WHERE month = '{m}' AND {key} IN ({fmt(same)});"
+                    )
+                    await tx.commit()
+                else:
+                    await tx.rollback()
+            moved += len(same)
+            last = rows[-1][key]
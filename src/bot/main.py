@@ -3,6 +3,7 @@ import argparse
 import asyncio
 import logging
 import os
+import signal
 from pathlib import Path
 from bot.services.live_state import TwitchLiveChecker
 from src.bot.services.telegram_notifier import TelegramNotifier
@@ -17,12 +18,27 @@ from dotenv import load_dotenv, find_dotenv
 from bot.config import Config
 from bot.data.store_ydb import WatchtimeStoreYDB
 from bot.services.accrual import AccrualService
+from bot.services.archiver import MonthArchiver
+from bot.services.blocklist import Blocklist
+from bot.services.profiler import SamplingProfiler
 from bot.services.twitch_bot import StreamStatsBot
+from bot.services.watchdog import LoopWatchdog
 
 logging.basicConfig(
     level=logging.INFO,
     format="[%(asctime)s] %(levelname)s %(name)s: %(message)s",
 )
+log = logging.getLogger(__name__)
+
+def _add_signal_handler(sig_name: str, callback) -> None:
+    """Вешает обработчик сигнала на loop, если платформа это поддерживает (не Windows)."""
+    sig = getattr(signal, sig_name, None)
+    if sig is None:
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(sig, callback)
+    except NotImplementedError:
+        log.info("Signal handlers are not supported, %s ignored", sig_name)
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Stream Stats Bot (YDB)")
@@ -49,8 +65,25 @@ async def _run() -> None:
     if cfg.db_provider != "ydb":
         raise RuntimeError("This build supports only DB_PROVIDER=ydb")
 
+    watchdog = LoopWatchdog(threshold_sec=cfg.loop_lag_threshold_ms / 1000)
+    await watchdog.start()
+
+    # профиль по сигналу: kill -USR1 <pid>
+    profiler = SamplingProfiler(cfg.profile_dir)
+    _add_signal_handler("SIGUSR1", lambda: asyncio.create_task(profiler.capture(cfg.profile_seconds)))
+
     store = WatchtimeStoreYDB(endpoint=cfg.ydb_endpoint, database=cfg.ydb_database)
     await store.init()
+
+    # перенос закрытых месяцев в архив
+    archiver = MonthArchiver(
+        store=store,
+        check_interval_sec=cfg.archive_check_seconds,
+        batch_size=cfg.archive_batch_size,
+        # тик начисления + запас на медленную запись в YDB
+        grace_sec=cfg.tick_interval_sec + 600,
+    )
+    await archiver.start()
     
     tg_token = os.getenv("TG_BOT_TOKEN")
     tg_chat = os.getenv("TG_CHAT_ID")
@@ -82,6 +115,9 @@ async def _run() -> None:
         should_accrue=lambda: live_checker.is_live,
     )
 
+    blocklist = Blocklist(cfg.blocklist_file or None)
+    await blocklist.reload()
+
     bot = StreamStatsBot(
         token=cfg.oauth_token,
         nick=cfg.bot_username,
@@ -89,16 +125,24 @@ async def _run() -> None:
         default_top_n=cfg.default_top_n,
         store=store,
         accrual=accrual,
+        blocklist=blocklist,
+        profiler=profiler,
+        profile_seconds=cfg.profile_seconds,
     )
 
+    # перечитать блоклист: kill -HUP <pid>
+    _add_signal_handler("SIGHUP", lambda: asyncio.create_task(bot.reload_blocklist()))
+
     try:
         await bot.start()
     finally:
         await accrual.stop()
+        await archiver.stop()
         await live_checker.stop()
         if notifier:
             await notifier.stop()
         await store.close()
+        await watchdog.stop()
 
 def main() -> None:
     args = parse_args()
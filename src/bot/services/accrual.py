@@ -1,13 +1,19 @@
 from __future__ import annotations
 import asyncio
-from datetime import datetime
-from typing import Dict, Callable
+import logging
+import sys
+from array import array
+from typing import Dict, Callable, List
 
 from bot.util.time import utcnow, month_key
 
+log = logging.getLogger(__name__)
+
 class AccrualService:
     """
     Каждые tick_interval_sec начисляет +1 минуту всем, кто писал в чат за последние active_window_sec.
+    Активность хранится по Twitch user-id: id интернируются в слот, а id/время/логин лежат
+    в параллельных массивах — без словаря строк на каждого зрителя.
     """
     def __init__(
         self,
@@ -21,13 +27,39 @@ class AccrualService:
         self.active_window_sec = active_window_sec
         self.should_accrue = should_accrue or (lambda: True)
 
-        self.last_seen: Dict[str, datetime] = {}
+        self._slot: Dict[int, int] = {}  # user_id -> индекс в массивах
+        self._ids = array("Q")           # user_id по слотам
+        self._seen = array("d")          # unix-время последнего сообщения по слотам
+        self._logins: List[str] = []     # последний логин по слотам (интернированный)
+        self._pending: Dict[int, str] = {}  # новые/переименованные — ждут записи в users
+
         self._task: asyncio.Task | None = None
         self._stop = asyncio.Event()
 
-    def mark_active(self, username: str) -> None:
-        if username:
-            self.last_seen[username] = utcnow()
+    def mark_active(self, user_id: int, login: str) -> None:
+        if not user_id:
+            return
+        slot = self._slot.get(user_id)
+        if slot is None:
+            slot = len(self._ids)
+            self._slot[user_id] = slot
+            self._ids.append(user_id)
+            self._seen.append(0.0)
+            self._logins.append(sys.intern(login))
+            self._pending[user_id] = login
+        elif self._logins[slot] != login:
+            self._logins[slot] = sys.intern(login)
+            self._pending[user_id] = login
+        self._seen[slot] = utcnow().timestamp()
+
+    def forget(self, predicate: Callable[[str], bool]) -> int:
+        """Убирает из активных тех, для кого predicate(логин) истинен (например, после reload блоклиста)."""
+        dropped = 0
+        for slot, login in enumerate(self._logins):
+            if self._seen[slot] and predicate(login):
+                self._seen[slot] = 0.0
+                dropped += 1
+        return dropped
 
     async def start(self) -> None:
         if self._task:
@@ -47,15 +79,32 @@ class AccrualService:
         except asyncio.CancelledError:
             pass
 
+    async def _flush_logins(self, mkey: str) -> Dict[int, str]:
+        """Пишет новые логины (и сливает их старые строки). Возвращает то, что записать не удалось."""
+        if not self._pending:
+            return {}
+        pending, self._pending = self._pending, {}
+        try:
+            await self.store.upsert_users(mkey, pending)
+        except Exception:
+            # вернём в очередь, более свежие логины не перетираем
+            self._pending = {**pending, **self._pending}
+            log.exception("Failed to store user logins")
+            return pending
+        return {}
+
     async def _accrue_once(self) -> None:
+        mkey = month_key()
+        unfolded = await self._flush_logins(mkey)
+
         if not self.should_accrue():
             return  # эфир не идёт
 
-        now = utcnow().timestamp()
-        cutoff = now - self.active_window_sec
-        active = [u for u, ts in list(self.last_seen.items()) if ts.timestamp() >= cutoff]
+        cutoff = utcnow().timestamp() - self.active_window_sec
+        # пока старая строка не слита в watchtime_ids, не начисляем — иначе зритель задвоится в !top
+        active = array("Q", (
+            uid for uid, ts in zip(self._ids, self._seen) if ts >= cutoff and uid not in unfolded
+        ))
         if not active:
             return
-        mkey = month_key()
-        for u in active:
-            await self.store.add_minutes(mkey, u, 1)
+        await self.store.add_minutes_bulk(mkey, active, 1)
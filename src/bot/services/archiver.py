@@ -0,0 +1,59 @@
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from bot.util.time import utcnow, month_key
+
+log = logging.getLogger(__name__)
+
+class MonthArchiver:
+    """
+    Следит за сменой месяца (month_key()) и переносит закрытые месяцы из горячей таблицы в архив.
+    Месяц M считается закрытым только после start(M+1) + grace_sec: запоздавший тик начисления,
+    прочитавший month_key() до полуночи, успевает дописать свою строку до архивации.
+    При старте догоняет всё, что осталось с прошлых запусков. При ошибке повторит на следующей проверке.
+    """
+    def __init__(self, store, check_interval_sec: int = 300, batch_size: int = 500, grace_sec: int = 600) -> None:
+        self.store = store
+        self.check_interval_sec = max(30, int(check_interval_sec))
+        self.batch_size = batch_size
+        self.grace_sec = max(0, int(grace_sec))
+
+        self._month: Optional[str] = None  # последний полностью обработанный текущий месяц
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    async def start(self) -> None:
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _loop(self) -> None:
+        try:
+            while not self._stop.is_set():
+                # «текущий» месяц сдвинут на grace: до start(M+1) + grace месяц M ещё открыт
+                current = month_key(utcnow() - timedelta(seconds=self.grace_sec))
+                if current != self._month:
+                    await self._archive_closed(current)
+                await asyncio.sleep(self.check_interval_sec)
+        except asyncio.CancelledError:
+            pass
+
+    async def _archive_closed(self, current: str) -> None:
+        try:
+            for month in await self.store.closed_months(current):
+                rows = await self.store.archive_month(month, batch_size=self.batch_size)
+                log.info("Archived month %s: %d rows moved to cold storage", month, rows)
+            # строки, изменившиеся во время переноса, остались в горячей таблице — повторим на следующей проверке
+            if not await self.store.closed_months(current):
+                self._month = current
+        except Exception:
+            log.exception("Month archival failed, will retry")
@@ -0,0 +1,55 @@
+from __future__ import annotations
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import FrozenSet, Iterable, Optional
+
+log = logging.getLogger(__name__)
+
+# известные чат-боты — исключаются всегда, даже без файла
+KNOWN_BOTS: FrozenSet[str] = frozenset({
+    "nightbot", "streamelements", "streamlabs", "moobot", "fossabot",
+    "wizebot", "soundalerts", "sery_bot", "commanderroot", "streamstickers",
+})
+
+class Blocklist:
+    """
+    Логины, которые не копят минуты (чат-боты, накрутка зрителей).
+    Файл: один логин на строку, '#' — комментарий. Рассчитан на десятки тысяч записей.
+    Хранится как frozenset интернированных строк: проверка O(1) и атомарная подмена при reload.
+    """
+    def __init__(self, path: Optional[str] = None, extra: Iterable[str] = KNOWN_BOTS) -> None:
+        self.path = Path(path) if path else None
+        self._extra = frozenset(e.lower() for e in extra if e)
+        self._logins: FrozenSet[str] = self._extra
+
+    def __contains__(self, login: str) -> bool:
+        # twitchio отдаёт логин в нижнем регистре
+        return login in self._logins
+
+    def __len__(self) -> int:
+        return len(self._logins)
+
+    def _read(self) -> FrozenSet[str]:
+        assert self.path is not None
+        logins = set(self._extra)
+        # utf-8-sig: BOM из «Блокнота» не приклеится к первому логину
+        with self.path.open("r", encoding="utf-8-sig") as f:
+            for line in f:
+                login = line.split("#", 1)[0].strip().lstrip("@").lower()
+                if login:
+                    logins.add(sys.intern(login))
+        return frozenset(logins)
+
+    async def reload(self) -> int:
+        """Перечитывает файл в отдельном потоке. При ошибке оставляет прежний список."""
+        if self.path is None:
+            return len(self._logins)
+        try:
+            self._logins = await asyncio.to_thread(self._read)
+        except (OSError, UnicodeError):
+            log.exception("Failed to load blocklist %s, keeping %d entries", self.path, len(self._logins))
+            return len(self._logins)
+        log.info("Blocklist loaded: %d logins from %s", len(self._logins), self.path)
+        return len(self._logins)
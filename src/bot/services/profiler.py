@@ -0,0 +1,74 @@
+from __future__ import annotations
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик для работающего процесса, без перезапуска.
+    Раз в interval_sec снимает стеки всех потоков (sys._current_frames) и пишет
+    агрегированный результат в формате folded stacks (flamegraph.pl / speedscope).
+    """
+    def __init__(self, out_dir: str, interval_sec: float = 0.005, max_seconds: int = 120) -> None:
+        self.out_dir = Path(out_dir)
+        self.interval_sec = max(0.001, float(interval_sec))
+        self.max_seconds = max(1, int(max_seconds))
+        self._busy = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._busy.locked()
+
+    async def capture(self, seconds: float) -> Optional[Path]:
+        """Снимает профиль за seconds секунд. Возвращает путь к файлу или None, если съёмка уже идёт."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            duration = max(1.0, min(float(seconds), float(self.max_seconds)))
+            log.info("Sampling profile for %.0f s...", duration)
+            path = await asyncio.to_thread(self._run, duration)
+            log.info("Profile written: %s", path)
+            return path
+        finally:
+            self._busy.release()
+
+    def _run(self, duration: float) -> Path:
+        stacks: Counter[str] = Counter()
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        samples = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stacks[self._fold(names.get(tid, str(tid)), frame)] += 1
+            samples += 1
+            time.sleep(self.interval_sec)
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        path = self.out_dir / time.strftime("profile-%Y%m%d-%H%M%S.folded")
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        log.info("Profile: %d samples, %d unique stacks", samples, len(stacks))
+        return path
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name}:{Path(code.co_filename).name}:{frame.f_lineno}")
+            frame = frame.f_back
+        parts.append(thread_name.replace(" ", "_"))
+        return ";".join(reversed(parts))
@@ -2,13 +2,15 @@ from __future__ import annotations
 import logging
 from twitchio.ext import commands
 
-from bot.util.time import month_key
+from bot.util.time import month_key, parse_month_key
 from bot.services.accrual import AccrualService
+from bot.services.blocklist import Blocklist
+from bot.services.profiler import SamplingProfiler
 
 log = logging.getLogger(__name__)
 
 HELP = (
-    "Команды: !top [N] — топ за месяц; !watchtime [ник] — минуты зрителя; "
+    "Команды: !top [N] [ГГГГ-ММ] — топ за месяц; !watchtime [ник] — минуты зрителя; "
     "!settopn N — дефолтный размер топа (стример/мод); !help — помощь."
 )
 
@@ -17,15 +19,35 @@ def fmt_minutes(minutes: int) -> str:
     return f"{h}ч {m}м" if h else f"{m}м"
 
 class StreamStatsBot(commands.Bot):
-    def __init__(self, token: str, nick: str, channel: str, default_top_n: int, store, accrual: AccrualService):
+    def __init__(
+        self,
+        token: str,
+        nick: str,
+        channel: str,
+        default_top_n: int,
+        store,
+        accrual: AccrualService,
+        blocklist: Blocklist | None = None,
+        profiler: SamplingProfiler | None = None,
+        profile_seconds: int = 30,
+    ):
         super().__init__(token=token, prefix="!", initial_channels=[f"#{channel}"], nick=nick)
         self.default_top_n = default_top_n
         self.store = store
         self.accrual = accrual
+        self.blocklist = blocklist or Blocklist()
+        self.profiler = profiler
+        self.profile_seconds = profile_seconds
         # нормализованные логины (нижний регистр)
         self.bot_login = (nick or "").lower()
         self.channel_login = (channel or "").lower()
 
+    async def reload_blocklist(self) -> tuple[int, int]:
+        """Перечитывает блоклист и убирает новых заблокированных из активных. -> (логинов, убрано)."""
+        total = await self.blocklist.reload()
+        dropped = self.accrual.forget(self.blocklist.__contains__)
+        return total, dropped
+
     async def event_ready(self):
         log.info("Connected as %s", self.nick)
         await self.accrual.start()
@@ -35,7 +57,11 @@ class StreamStatsBot(commands.Bot):
         if not message.author or not message.author.name:
             return
 
-        self.accrual.mark_active(message.author.name)
+        # боты и накрутка не попадают ни в активных, ни в БД
+        author = message.author
+        if author.id and author.name not in self.blocklist:
+            # стабильный user-id из IRC-тегов, логин — только для отображения
+            self.accrual.mark_active(int(author.id), author.name)
         await self.handle_commands(message)
 
     @commands.command(name="help")
@@ -43,9 +69,21 @@ class StreamStatsBot(commands.Bot):
         await ctx.send(HELP)
 
     @commands.command(name="top")
-    async def top_cmd(self, ctx: commands.Context, n: int | None = None):
-        n = max(1, min(50, n or self.default_top_n))
+    async def top_cmd(self, ctx: commands.Context, arg1: str | None = None, arg2: str | None = None):
+        # !top [N] [YYYY-MM] в любом порядке
+        n: int | None = None
         mkey = month_key()
+        for arg in (arg1, arg2):
+            if arg is None:
+                continue
+            if arg.isdecimal():
+                n = int(arg)
+            elif parse_month_key(arg):
+                mkey = arg
+            else:
+                await ctx.send("Использование: !top [N] [ГГГГ-ММ]")
+                return
+        n = max(1, min(50, n or self.default_top_n))
         # исключаем из вывода стримера и бота
         exclude = [self.channel_login, self.bot_login]
         top = await self.store.get_top(mkey, n, exclude=exclude)
@@ -57,12 +95,17 @@ class StreamStatsBot(commands.Bot):
 
     @commands.command(name="time", aliases=["wt"])
     async def watchtime_cmd(self, ctx: commands.Context, nickname: str | None = None):
-        user = nickname or (ctx.author.name if ctx.author else "")
+        user_id: int | None = None
+        if nickname:
+            user = nickname.lstrip("@").lower()
+        else:
+            user = ctx.author.name if ctx.author else ""
+            user_id = int(ctx.author.id) if ctx.author and ctx.author.id else None
         if not user:
             await ctx.send("Не удалось определить ник.")
             return
         mkey = month_key()
-        minutes = await self.store.get_minutes(mkey, user)
+        minutes = await self.store.get_minutes(mkey, user, user_id=user_id)
         await ctx.send(f"{user}: {fmt_minutes(minutes)} за {mkey}.")
 
     @commands.command(name="settopn")
@@ -75,6 +118,32 @@ class StreamStatsBot(commands.Bot):
             return
         self.default_top_n = n
         await ctx.send(f"Топ по умолчанию теперь: {self.default_top_n}.")
+
+    @commands.command(name="blockreload")
+    async def blockreload_cmd(self, ctx: commands.Context):
+        if not (ctx.author and (ctx.author.is_broadcaster or ctx.author.is_mod)):
+            await ctx.send("Эта команда доступна только стримеру или модератору.")
+            return
+        total, dropped = await self.reload_blocklist()
+        await ctx.send(f"Блоклист перечитан: {total} логинов, убрано из активных: {dropped}.")
+
+    @commands.command(name="profile")
+    async def profile_cmd(self, ctx: commands.Context, seconds: int | None = None):
+        if not (ctx.author and (ctx.author.is_broadcaster or ctx.author.is_mod)):
+            await ctx.send("Эта команда доступна только стримеру или модератору.")
+            return
+        if not self.profiler:
+            await ctx.send("Профилировщик не настроен.")
+            return
+        if self.profiler.running:
+            await ctx.send("Профиль уже снимается.")
+            return
+        secs = max(1, min(self.profiler.max_seconds, seconds or self.profile_seconds))
+        await ctx.send(f"Снимаю профиль {secs} с...")
+        path = await self.profiler.capture(secs)
+        if path:
+            await ctx.send(f"Профиль сохранён: {path.name}")
+
     @commands.command(name="live")
     async def live_cmd(self, ctx: commands.Context):
         # простая проверка через accrual.should_accrue()
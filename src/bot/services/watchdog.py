@@ -0,0 +1,87 @@
+from __future__ import annotations
+import asyncio
+import io
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+class LoopWatchdog:
+    """
+    Непрерывно измеряет лаг event loop'а.
+    Корутина-«пульс» спит interval_sec и сравнивает фактическое время пробуждения с ожидаемым.
+    Отдельный поток следит за пульсом: если пульса нет дольше threshold_sec + interval_sec,
+    логирует стек текущего (блокирующего) колбэка, а после восстановления — стеки всех задач.
+    Пульс частый (по умолчанию threshold_sec / 4, не реже threshold_sec / 2), поэтому блокировка
+    незамеченной остаётся, только если она короче ~threshold_sec + interval_sec.
+    """
+    def __init__(self, threshold_sec: float = 0.25, interval_sec: Optional[float] = None) -> None:
+        self.threshold_sec = max(0.01, float(threshold_sec))
+        interval = self.threshold_sec / 4 if interval_sec is None else float(interval_sec)
+        self.interval_sec = max(0.002, min(interval, self.threshold_sec / 2))
+        self.max_lag_sec: float = 0.0
+
+        self._beat: float = 0.0  # monotonic-время последнего пульса
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = asyncio.Event()
+        self._thread_stop = threading.Event()
+
+    async def start(self) -> None:
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._loop(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        self._thread_stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    async def _loop(self) -> None:
+        try:
+            while not self._stop.is_set():
+                t0 = time.monotonic()
+                self._beat = t0
+                await asyncio.sleep(self.interval_sec)
+                lag = time.monotonic() - t0 - self.interval_sec
+                if lag >= self.threshold_sec:
+                    self.max_lag_sec = max(self.max_lag_sec, lag)
+                    log.warning("Event loop lag %.0f ms (max %.0f ms). Tasks:\n%s",
+                                lag * 1000, self.max_lag_sec * 1000, self._format_tasks())
+        except asyncio.CancelledError:
+            pass
+
+    def _watch(self) -> None:
+        # работает в отдельном потоке: видит loop, пока тот заблокирован
+        reported: float | None = None
+        poll = self.interval_sec / 2
+        while not self._thread_stop.wait(poll):
+            beat = self._beat
+            since = time.monotonic() - beat
+            if since < self.threshold_sec + self.interval_sec or reported == beat:
+                continue
+            stalled = since - self.interval_sec
+            reported = beat  # по одному отчёту на каждое зависание
+            frame = sys._current_frames().get(self._loop_thread_id or 0)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<нет стека>"
+            log.warning("Event loop blocked for %.0f ms, current callback:\n%s", stalled * 1000, stack)
+
+    @staticmethod
+    def _format_tasks(limit: int = 8) -> str:
+        buf = io.StringIO()
+        for task in asyncio.all_tasks():
+            task.print_stack(limit=limit, file=buf)
+        return buf.getvalue()
@@ -1,9 +1,17 @@
 from __future__ import annotations
+import re
 from datetime import datetime, timezone
 
+_MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
 def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 def month_key(dt: datetime | None = None) -> str:
     d = dt or utcnow()
     return d.strftime("%Y-%m")
+
+def parse_month_key(s: str | None) -> str | None:
+    """'2024-05' -> '2024-05', всё остальное -> None."""
+    s = (s or "").strip()
+    return s if _MONTH_RE.match(s) else None